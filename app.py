@@ -2,23 +2,25 @@ import streamlit as st
 import pandas as pd
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add utils to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from utils.database import init_db, get_all_feedback, add_feedback
-from utils.perplexity_client import (
-    analyze_review_sentiment,
-    generate_ai_response,
-    generate_summary,
-    generate_recommendations,
+from utils.database import (
+    init_db,
+    get_all_feedback,
+    get_filtered_feedback,
+    count_filtered_feedback,
+    get_feedback_list,
+    get_feedback_full,
+    add_feedback,
 )
+from utils.perplexity_client import analyze_feedback_all, stream_ai_response
 from utils.analytics import (
-    get_rating_distribution,
-    get_sentiment_breakdown,
     calculate_stats,
-    get_recent_feedback,
+    get_dashboard_breakdowns,
 )
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -35,6 +37,18 @@ st.set_page_config(
 # Initialize database
 init_db()
 
+# Number of submissions shown per page of the admin feedback list
+FEEDBACK_PAGE_SIZE = 20
+
+# Display lookups shared by both dashboards
+RATING_EMOJI = {1: "😞", 2: "😕", 3: "😐", 4: "🙂", 5: "😄"}
+SENTIMENT_EMOJI = {
+    "positive": "😊",
+    "negative": "😞",
+    "neutral": "😐",
+}
+STAR_STRINGS = tuple("⭐" * n for n in range(6))
+
 # ═══════════════════════════════════════════════════════════════════════════
 # MAIN DASHBOARD (USER-FACING)
 # ═══════════════════════════════════════════════════════════════════════════
@@ -90,8 +104,7 @@ def render_user_dashboard():
             )
 
         # Show rating with emoji
-        emoji_map = {1: "😞", 2: "😕", 3: "😐", 4: "🙂", 5: "😄"}
-        st.markdown(f"**Your Rating:** {emoji_map[rating]} {rating}/5 Stars")
+        st.markdown(f"**Your Rating:** {RATING_EMOJI[rating]} {rating}/5 Stars")
 
         message = st.text_area(
             "Your Feedback",
@@ -115,10 +128,25 @@ def render_user_dashboard():
             else:
                 with st.spinner("🤖 AI is processing your feedback..."):
                     try:
-                        # Generate AI analysis
-                        sentiment = analyze_review_sentiment(message)
-                        ai_response = generate_ai_response(message, category)
-                        summary = generate_summary(message)
+                        status = st.empty()
+                        st.markdown("---")
+                        col1, col2 = st.columns(2)
+
+                        # Stream the customer response while sentiment, summary
+                        # and recommendations come back from a single call
+                        with ThreadPoolExecutor(max_workers=1) as executor:
+                            analysis_future = executor.submit(
+                                analyze_feedback_all, message, category, include_response=False
+                            )
+
+                            with col1:
+                                st.markdown("### 🤖 AI Response")
+                                ai_response = st.write_stream(stream_ai_response(message, category))
+
+                            analysis = analysis_future.result()
+
+                        sentiment = analysis["sentiment"]
+                        summary = analysis["summary"]
 
                         # Store in database
                         add_feedback(
@@ -130,36 +158,35 @@ def render_user_dashboard():
                             sentiment=sentiment,
                             ai_response=ai_response,
                             summary=summary,
+                            recommendations=analysis["recommendations"],
                         )
 
-                        st.success("✅ Thank you for your feedback!")
-
-                        # Show AI response
-                        st.markdown("---")
-                        col1, col2 = st.columns(2)
-
-                        with col1:
-                            st.markdown("### 🤖 AI Response")
-                            st.info(ai_response)
+                        status.success("✅ Thank you for your feedback!")
 
                         with col2:
                             st.markdown("### 📝 AI Summary")
                             st.info(summary)
 
                         # Show sentiment
-                        sentiment_emoji = {
-                            "positive": "😊",
-                            "negative": "😞",
-                            "neutral": "😐",
-                        }
                         st.markdown(
-                            f"**Sentiment Detected:** {sentiment_emoji.get(sentiment, '🤔')} **{sentiment.upper()}**"
+                            f"**Sentiment Detected:** {SENTIMENT_EMOJI.get(sentiment, '🤔')} **{sentiment.upper()}**"
                         )
 
                     except Exception as e:
                         st.error(f"❌ Error processing feedback: {str(e)}")
 
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def export_files(export_key):
+    """CSV and JSON exports of the filtered feedback from one query, cached per filter selection"""
+    categories, sentiments, min_rating, max_rating, _ = export_key
+    df = get_filtered_feedback(categories, sentiments, min_rating, max_rating)
+    return (
+        df.to_csv(index=False).encode("utf-8"),
+        df.to_json(orient="records", indent=2).encode("utf-8"),
+    )
+
+
 def render_admin_dashboard():
     """Admin-facing dashboard showing all submissions"""
     st.title("📊 Admin Dashboard - Feedback Management")
@@ -176,21 +203,20 @@ def render_admin_dashboard():
     # KEY METRICS
     # ─────────────────────────────────────────────────────────────
 
+    stats = calculate_stats(df)
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        st.metric("Total Submissions", len(df))
+        st.metric("Total Submissions", stats["total"])
 
     with col2:
-        avg_rating = df["rating"].mean()
-        st.metric("Avg Rating", f"{avg_rating:.1f}⭐")
+        st.metric("Avg Rating", f"{stats['avg_rating']:.1f}⭐")
 
     with col3:
-        positive = len(df[df["sentiment"] == "positive"])
-        st.metric("Positive Reviews", f"{positive}/{len(df)}")
+        st.metric("Positive Reviews", f"{stats['positive_count']}/{stats['total']}")
 
     with col4:
-        satisfaction = (len(df[df["rating"] >= 4]) / len(df)) * 100
+        satisfaction = (stats["satisfied_count"] / stats["total"]) * 100
         st.metric("Satisfaction Rate", f"{satisfaction:.0f}%")
 
     st.markdown("---")
@@ -200,25 +226,39 @@ def render_admin_dashboard():
     # ─────────────────────────────────────────────────────────────
 
     st.subheader("📈 Analytics")
+    rating_dist, sentiment_dist, category_dist = get_dashboard_breakdowns(df)
     col1, col2, col3 = st.columns(3)
 
     with col1:
         st.markdown("### Rating Distribution")
-        rating_dist = get_rating_distribution(df)
         st.bar_chart(rating_dist)
 
     with col2:
         st.markdown("### Sentiment Breakdown")
-        sentiment_dist = get_sentiment_breakdown(df)
         st.bar_chart(sentiment_dist)
 
     with col3:
         st.markdown("### Feedback by Category")
-        category_dist = df["category"].value_counts()
         st.bar_chart(category_dist)
 
     st.markdown("---")
 
+    render_feedback_browser(
+        categories=df["category"].unique(),
+        sentiments=df["sentiment"].unique(),
+        total_count=len(df),
+        latest_id=int(df["id"].max()),
+    )
+
+
+@st.fragment
+def render_feedback_browser(categories, sentiments, total_count, latest_id):
+    """Filters, detailed feedback list and export
+
+    Runs as a fragment, so changing a filter or page only reruns this
+    section instead of the metrics and charts above it.
+    """
+
     # ─────────────────────────────────────────────────────────────
     # FILTERS
     # ─────────────────────────────────────────────────────────────
@@ -229,15 +269,15 @@ def render_admin_dashboard():
     with col1:
         selected_category = st.multiselect(
             "Category",
-            df["category"].unique(),
-            default=df["category"].unique(),
+            categories,
+            default=categories,
         )
 
     with col2:
         selected_sentiment = st.multiselect(
             "Sentiment",
-            df["sentiment"].unique(),
-            default=df["sentiment"].unique(),
+            sentiments,
+            default=sentiments,
         )
 
     with col3:
@@ -249,14 +289,18 @@ def render_admin_dashboard():
         )
 
     # Apply filters
-    filtered_df = df[
-        (df["category"].isin(selected_category))
-        & (df["sentiment"].isin(selected_sentiment))
-        & (df["rating"] >= min_rating)
-        & (df["rating"] <= max_rating)
-    ]
-
-    st.markdown(f"**Showing {len(filtered_df)} of {len(df)} submissions**")
+    filters = (selected_category, selected_sentiment, min_rating, max_rating)
+    filtered_count = count_filtered_feedback(*filters)
+
+    # (created_at, id) cursor where each visited page starts (None = newest);
+    # restart when filters change
+    filter_key = (tuple(selected_category), tuple(selected_sentiment), min_rating, max_rating)
+    if st.session_state.get("feedback_filter_key") != filter_key:
+        st.session_state.feedback_filter_key = filter_key
+        st.session_state.feedback_page_cursors = [None]
+    page_cursors = st.session_state.feedback_page_cursors
+
+    st.markdown(f"**Showing {filtered_count} of {total_count} submissions**")
     st.markdown("---")
 
     # ─────────────────────────────────────────────────────────────
@@ -265,58 +309,73 @@ def render_admin_dashboard():
 
     st.subheader("📋 Detailed Feedback List")
 
-    if len(filtered_df) == 0:
+    if filtered_count == 0:
         st.warning("No feedback matches the selected filters.")
     else:
-        for idx, row in filtered_df.iterrows():
+        total_pages = (filtered_count - 1) // FEEDBACK_PAGE_SIZE + 1
+        page = len(page_cursors)
+        page_df = get_feedback_list(
+            *filters,
+            limit=FEEDBACK_PAGE_SIZE,
+            before=page_cursors[-1],
+        )
+
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button(
+                "◀ Previous",
+                key="feedback_prev_page",
+                disabled=page == 1,
+                on_click=page_cursors.pop,
+            )
+        with col2:
+            st.markdown(f"Page {page} of {total_pages}")
+        with col3:
+            st.button(
+                "Next ▶",
+                key="feedback_next_page",
+                disabled=page >= total_pages,
+                on_click=page_cursors.append,
+                args=((page_df["created_at"].iloc[-1], int(page_df["id"].iloc[-1])),),
+            )
+
+        for row in page_df.itertuples(index=False, name="Row"):
             with st.container():
                 col1, col2 = st.columns([3, 1])
 
                 with col1:
-                    # Header
-                    rating_emoji = "⭐" * row["rating"]
-                    st.markdown(
-                        f"**{row['user_name']}** — {row['category']} | {rating_emoji} ({row['rating']}/5)"
-                    )
-
-                    # Content
-                    st.markdown(f"__{row['created_at'][:10]}__")
-                    st.markdown(f"📝 **Review:** {row['message'][:200]}...")
-
-                    # AI Analysis
-                    col_a, col_b = st.columns(2)
-                    with col_a:
-                        st.markdown(f"**Summary:** {row['summary'][:150]}...")
-                    with col_b:
-                        sentiment_emoji = {
-                            "positive": "😊",
-                            "negative": "😞",
-                            "neutral": "😐",
-                        }
-                        st.markdown(
-                            f"**Sentiment:** {sentiment_emoji.get(row['sentiment'], '🤔')} {row['sentiment'].upper()}"
-                        )
+                    # Header, content and AI analysis in a single write
+                    lines = [
+                        f"**{row.user_name}** — {row.category} | {STAR_STRINGS[row.rating]} ({row.rating}/5)",
+                        f"__{row.day}__",
+                        f"📝 **Review:** {row.msg_preview}...",
+                        f"**Summary:** {row.summary_preview}...",
+                        f"**Sentiment:** {SENTIMENT_EMOJI.get(row.sentiment, '🤔')} {row.sentiment.upper()}",
+                    ]
 
                     # Recommendations (if available)
-                    if pd.notna(row.get("recommendations")):
-                        st.markdown(f"💡 **Actions:** {row['recommendations'][:150]}...")
+                    if pd.notna(row.rec_preview):
+                        lines.append(f"💡 **Actions:** {row.rec_preview}...")
+
+                    st.markdown("\n\n".join(lines))
 
                 with col2:
                     # Action buttons
-                    if st.button("👁️ View Full", key=f"view_{idx}"):
+                    if st.button("👁️ View Full", key=f"view_{row.id}"):
+                        full = get_feedback_full(row.id)
                         st.markdown("### Full Details")
                         st.json(
                             {
-                                "Name": row["user_name"],
-                                "Email": row.get("email", "N/A"),
-                                "Category": row["category"],
-                                "Rating": row["rating"],
-                                "Review": row["message"],
-                                "Sentiment": row["sentiment"],
-                                "Summary": row["summary"],
-                                "AI Response": row.get("ai_response", "N/A"),
-                                "Recommendations": row.get("recommendations", "N/A"),
-                                "Date": row["created_at"],
+                                "Name": full["user_name"],
+                                "Email": full["email"],
+                                "Category": full["category"],
+                                "Rating": full["rating"],
+                                "Review": full["message"],
+                                "Sentiment": full["sentiment"],
+                                "Summary": full["summary"],
+                                "AI Response": full["ai_response"],
+                                "Recommendations": full["recommendations"],
+                                "Date": full["created_at"],
                             }
                         )
 
@@ -329,20 +388,28 @@ def render_admin_dashboard():
     st.subheader("💾 Export Data")
     col1, col2 = st.columns(2)
 
+    # Latest id identifies the table contents, which only grow
+    export_key = (
+        tuple(selected_category),
+        tuple(selected_sentiment),
+        min_rating,
+        max_rating,
+        latest_id,
+    )
+    csv_export, json_export = export_files(export_key)
+
     with col1:
-        csv_data = filtered_df.to_csv(index=False)
         st.download_button(
             label="📥 Download as CSV",
-            data=csv_data,
+            data=csv_export,
             file_name="feedback_export.csv",
             mime="text/csv",
         )
 
     with col2:
-        json_data = filtered_df.to_json(orient="records", indent=2)
         st.download_button(
             label="📥 Download as JSON",
-            data=json_data,
+            data=json_export,
             file_name="feedback_export.json",
             mime="application/json",
         )
@@ -8,7 +8,7 @@ def get_rating_distribution(df):
     """Get count of each rating (1-5)"""
     if len(df) == 0:
         return pd.Series()
-    return df['rating'].value_counts().sort_index()
+    return df['rating'].value_counts(sort=False).sort_index()
 
 
 def get_sentiment_breakdown(df):
@@ -19,7 +19,7 @@ def get_sentiment_breakdown(df):
 
 
 def calculate_stats(df):
-    """Calculate key statistics"""
+    """Calculate key statistics in one pass over each column"""
     if len(df) == 0:
         return {
             'total': 0,
@@ -27,17 +27,35 @@ def calculate_stats(df):
             'positive_count': 0,
             'negative_count': 0,
             'neutral_count': 0,
+            'satisfied_count': 0,
         }
 
+    ratings = df['rating'].to_numpy()
+    sentiment_counts = df['sentiment'].value_counts()
+
     return {
-        'total': len(df),
-        'avg_rating': df['rating'].mean(),
-        'positive_count': len(df[df['sentiment'] == 'positive']),
-        'negative_count': len(df[df['sentiment'] == 'negative']),
-        'neutral_count': len(df[df['sentiment'] == 'neutral']),
+        'total': len(ratings),
+        'avg_rating': ratings.mean(),
+        'positive_count': int(sentiment_counts.get('positive', 0)),
+        'negative_count': int(sentiment_counts.get('negative', 0)),
+        'neutral_count': int(sentiment_counts.get('neutral', 0)),
+        'satisfied_count': int((ratings >= 4).sum()),
     }
 
 
+def get_dashboard_breakdowns(df):
+    """Get rating, sentiment and category counts from a single groupby"""
+    if len(df) == 0:
+        return pd.Series(), pd.Series(), pd.Series()
+
+    counts = df.groupby(['rating', 'sentiment', 'category'], dropna=False).size()
+    return (
+        counts.groupby(level='rating').sum(),
+        counts.groupby(level='sentiment').sum(),
+        counts.groupby(level='category').sum(),
+    )
+
+
 def get_recent_feedback(df, n=10):
     """Get most recent n feedback items"""
     if len(df) == 0:
@@ -50,9 +68,13 @@ def get_feedback_by_date_range(df, days=30):
     if len(df) == 0:
         return pd.DataFrame()
     
-    df['created_at'] = pd.to_datetime(df['created_at'])
+    # get_all_feedback already parses created_at; other queries return strings
+    created_at = df['created_at']
+    if not pd.api.types.is_datetime64_any_dtype(created_at):
+        created_at = pd.to_datetime(created_at, format='ISO8601')
+
     cutoff_date = datetime.utcnow() - timedelta(days=days)
-    return df[df['created_at'] >= cutoff_date]
+    return df[created_at >= cutoff_date]
 
 
 def get_category_breakdown(df):
@@ -66,8 +88,7 @@ def calculate_satisfaction_rate(df):
     """Calculate satisfaction (4-5 stars) percentage"""
     if len(df) == 0:
         return 0
-    satisfied = len(df[df['rating'] >= 4])
-    return (satisfied / len(df)) * 100
+    return (df['rating'] >= 4).mean() * 100
 
 
 def get_top_categories(df, n=5):
@@ -88,4 +109,4 @@ def get_sentiment_by_rating(df):
     """Analyze sentiment distribution by rating"""
     if len(df) == 0:
         return pd.DataFrame()
-    return pd.crosstab(df['rating'], df['sentiment'])
\ No newline at end of file
+    return df.groupby(['rating', 'sentiment']).size().unstack(fill_value=0)
\ No newline at end of file
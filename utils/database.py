@@ -1,83 +1,207 @@
 # utils/database.py
 
 import sqlite3
+import threading
 import pandas as pd
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import os
 
 DB_PATH = os.path.join("data", "feedback.db")
 
+# One connection shared by every query; the lock serializes its use across
+# Streamlit's script threads
+_conn = None
+_conn_lock = threading.RLock()
+
+# Shared by add_feedback and add_feedback_bulk so sqlite3's statement cache
+# reuses one compiled statement
+_INSERT_FEEDBACK_SQL = """
+    INSERT INTO feedback
+    (user_name, email, category, rating, message, sentiment, summary, ai_response, recommendations, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Last result of get_all_feedback and the highest id it contains
+_feedback_cache = {"df": None, "max_id": 0}
+_feedback_cache_lock = threading.Lock()
+
+
+def get_conn():
+    """Return the shared SQLite connection, opening it on first use"""
+    global _conn
+
+    with _conn_lock:
+        if _conn is None:
+            os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-20000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            _conn = conn
+        return _conn
+
+
+@contextmanager
+def _transaction():
+    """Run the enclosed statements as one write transaction on the shared connection"""
+    with _conn_lock:
+        conn = get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def _query_df(query, params=()):
+    """Run a SELECT on the shared connection and return the rows as a DataFrame
+
+    Rows are transposed into per-column lists so pandas builds each column
+    directly, skipping read_sql_query's row-wise record conversion.
+    """
+    with _conn_lock:
+        cursor = get_conn().execute(query, params)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(dict(zip(columns, map(list, zip(*rows)))))
+
 
 def init_db():
     """Initialize SQLite database with feedback table"""
-    os.makedirs("data", exist_ok=True)
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_name TEXT NOT NULL,
-            email TEXT,
-            category TEXT NOT NULL,
-            rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-            message TEXT NOT NULL,
-            sentiment TEXT,
-            summary TEXT,
-            ai_response TEXT,
-            recommendations TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    with _transaction() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_name TEXT NOT NULL,
+                email TEXT,
+                category TEXT NOT NULL,
+                rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+                message TEXT NOT NULL,
+                sentiment TEXT,
+                summary TEXT,
+                ai_response TEXT,
+                recommendations TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_feedback_filter ON feedback(category, sentiment, rating)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_feedback_created ON feedback(created_at DESC)"
         )
-        """
-    )
-
-    conn.commit()
-    conn.close()
 
 
 def add_feedback(user_name, email, category, rating, message, sentiment, ai_response, summary, recommendations=None):
     """Add feedback record to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        """
-        INSERT INTO feedback
-        (user_name, email, category, rating, message, sentiment, summary, ai_response, recommendations, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+    with _transaction() as conn:
+        conn.execute(
+            _INSERT_FEEDBACK_SQL,
+            (
+                user_name,
+                email,
+                category,
+                rating,
+                message,
+                sentiment,
+                summary,
+                ai_response,
+                recommendations,
+                datetime.utcnow().isoformat(),
+            ),
+        )
+
+
+def add_feedback_bulk(records):
+    """Add many feedback records in a single transaction
+
+    Each record is a dict keyed like add_feedback's arguments; email,
+    sentiment, summary, ai_response, recommendations and created_at are
+    optional. created_at may be a datetime or an ISO 8601 string; it is
+    stored in add_feedback's isoformat() form so that rows compare
+    correctly as strings. Returns the number of rows inserted.
+    """
+    now = datetime.utcnow().isoformat()
+    rows = [
         (
-            user_name,
-            email,
-            category,
-            rating,
-            message,
-            sentiment,
-            summary,
-            ai_response,
-            recommendations,
-            datetime.utcnow().isoformat(),
-        ),
-    )
+            record["user_name"],
+            record.get("email"),
+            record["category"],
+            record["rating"],
+            record["message"],
+            record.get("sentiment"),
+            record.get("summary"),
+            record.get("ai_response"),
+            record.get("recommendations"),
+            _isoformat(record["created_at"]) if record.get("created_at") else now,
+        )
+        for record in records
+    ]
+
+    with _transaction() as conn:
+        conn.executemany(_INSERT_FEEDBACK_SQL, rows)
+
+    return len(rows)
 
-    conn.commit()
-    conn.close()
+
+def _isoformat(value):
+    """created_at as add_feedback stores it: naive UTC, "T"-separated isoformat()"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
 
 
 def get_all_feedback():
-    """Retrieve all feedback records ordered by newest first"""
+    """Retrieve all feedback records ordered by newest first
+
+    created_at is returned as datetime64. Feedback is append-only, so the
+    previous result is cached and later calls only read rows with a higher
+    id. The returned DataFrame is shared between callers and must not be
+    modified in place.
+    """
     if not os.path.exists(DB_PATH):
         return pd.DataFrame()
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        df = pd.read_sql_query(
-            "SELECT * FROM feedback ORDER BY created_at DESC",
-            conn,
-        )
-        conn.close()
+        with _feedback_cache_lock:
+            with _conn_lock:
+                max_id = get_conn().execute("SELECT MAX(id) FROM feedback").fetchone()[0] or 0
+
+            df = _feedback_cache["df"]
+            cached_max_id = _feedback_cache["max_id"]
+
+            # First load, or the table was recreated since the last one
+            if df is None or max_id < cached_max_id:
+                df, cached_max_id = None, 0
+
+            if df is None or max_id > cached_max_id:
+                new_rows = _query_df(
+                    "SELECT * FROM feedback WHERE id > ? ORDER BY created_at DESC",
+                    (cached_max_id,),
+                )
+                # Parsed once here so analytics can compare timestamps directly
+                new_rows["created_at"] = pd.to_datetime(new_rows["created_at"], format="ISO8601")
+                if df is None or len(df) == 0:
+                    df = new_rows
+                else:
+                    backfilled = new_rows["created_at"].min() < df["created_at"].iloc[0]
+                    df = pd.concat([new_rows, df], ignore_index=True)
+                    if backfilled:
+                        # Bulk imports may carry older timestamps than the cached rows
+                        df = df.sort_values("created_at", ascending=False, ignore_index=True)
+                _feedback_cache.update(df=df, max_id=max_id)
+
         return df if len(df) > 0 else pd.DataFrame()
     except Exception as e:
         print(f"Database error: {e}")
@@ -86,35 +210,102 @@ def get_all_feedback():
 
 def get_feedback_by_category(category):
     """Get feedback filtered by category"""
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query(
+    df = _query_df(
         "SELECT * FROM feedback WHERE category = ? ORDER BY created_at DESC",
-        conn,
-        params=(category,),
+        (category,),
     )
-    conn.close()
     return df if len(df) > 0 else pd.DataFrame()
 
 
 def get_feedback_by_sentiment(sentiment):
     """Get feedback filtered by sentiment"""
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query(
+    df = _query_df(
         "SELECT * FROM feedback WHERE sentiment = ? ORDER BY created_at DESC",
-        conn,
-        params=(sentiment,),
+        (sentiment,),
     )
-    conn.close()
     return df if len(df) > 0 else pd.DataFrame()
 
 
 def get_feedback_by_rating_range(min_rating, max_rating):
     """Get feedback within rating range"""
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query(
+    df = _query_df(
         "SELECT * FROM feedback WHERE rating >= ? AND rating <= ? ORDER BY created_at DESC",
-        conn,
-        params=(min_rating, max_rating),
+        (min_rating, max_rating),
+    )
+    return df if len(df) > 0 else pd.DataFrame()
+
+
+def _filter_clause(categories, sentiments, min_rating, max_rating):
+    """Build the WHERE clause and parameters for the admin dashboard filters"""
+    categories = list(categories)
+    sentiments = list(sentiments)
+    where = (
+        f"WHERE category IN ({', '.join('?' * len(categories))})"
+        f" AND sentiment IN ({', '.join('?' * len(sentiments))})"
+        " AND rating BETWEEN ? AND ?"
     )
-    conn.close()
-    return df if len(df) > 0 else pd.DataFrame()
\ No newline at end of file
+    return where, (*categories, *sentiments, min_rating, max_rating)
+
+
+def get_filtered_feedback(categories, sentiments, min_rating, max_rating):
+    """Get feedback matching the admin dashboard filters, newest first"""
+    if not len(categories) or not len(sentiments):
+        return pd.DataFrame()
+
+    where, params = _filter_clause(categories, sentiments, min_rating, max_rating)
+    df = _query_df(f"SELECT * FROM feedback {where} ORDER BY created_at DESC", params)
+    return df if len(df) > 0 else pd.DataFrame()
+
+
+def count_filtered_feedback(categories, sentiments, min_rating, max_rating):
+    """Count feedback matching the admin dashboard filters"""
+    if not len(categories) or not len(sentiments):
+        return 0
+
+    where, params = _filter_clause(categories, sentiments, min_rating, max_rating)
+    with _conn_lock:
+        return get_conn().execute(f"SELECT COUNT(*) FROM feedback {where}", params).fetchone()[0]
+
+
+def get_feedback_list(categories, sentiments, min_rating, max_rating, limit, before=None):
+    """Get one page of filtered feedback with only the columns the list view shows
+
+    Pages are keyset-paginated on (created_at, id), newest first, so bulk
+    imported rows with older timestamps sort by date rather than by when
+    they were inserted. Pass the (created_at, id) of the last row of the
+    previous page as before to get the next one. Long text columns are cut
+    to previews in SQLite; use get_feedback_full for a complete record.
+    """
+    if not len(categories) or not len(sentiments):
+        return pd.DataFrame()
+
+    where, params = _filter_clause(categories, sentiments, min_rating, max_rating)
+    if before is not None:
+        where += " AND (created_at, id) < (?, ?)"
+        params = (*params, *before)
+
+    df = _query_df(
+        f"""
+        SELECT id, user_name, category, rating, sentiment,
+               substr(message, 1, 200) AS msg_preview,
+               substr(summary, 1, 150) AS summary_preview,
+               substr(recommendations, 1, 150) AS rec_preview,
+               date(created_at) AS day,
+               created_at
+        FROM feedback {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+        """,
+        (*params, limit),
+    )
+    return df if len(df) > 0 else pd.DataFrame()
+
+
+def get_feedback_full(feedback_id):
+    """Get a single feedback record as a dict, or None if it does not exist"""
+    with _conn_lock:
+        cursor = get_conn().execute("SELECT * FROM feedback WHERE id = ?", (feedback_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
@@ -0,0 +1,359 @@
+# utils/perplexity_async.py
+
+import os
+import uuid
+import asyncio
+import logging
+import weakref
+import httpx
+from typing import Optional, Dict, List, Any
+
+from utils.perplexity_client import (
+    PERPLEXITY_API_URL,
+    PERPLEXITY_CONNECT_TIMEOUT,
+    PERPLEXITY_MAX_ATTEMPTS,
+    PERPLEXITY_MODEL,
+    PERPLEXITY_READ_TIMEOUT,
+    _ANALYSIS_PARAMS,
+    _BREAKER,
+    _RETRY_STATUSES,
+    _SENTIMENT_PARAMS,
+    CircuitOpenError,
+    PerplexityError,
+    PerplexityTimeout,
+    _get_api_key,
+    _cache_lookup,
+    _cache_store,
+    _error_body,
+    _json_dumps,
+    _json_loads,
+    _lexicon_sentiment,
+    _analysis_fallback,
+    _analysis_fields,
+    _analysis_messages,
+    _analysis_response_format,
+    _normalize_sentiment,
+    _parse_analysis,
+    _payload_cache_keys,
+    _retry_delay,
+    _sentiment_messages,
+    _short_analysis,
+    _status_error,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Bulkhead for the async client: requests in flight at once per event
+# loop. As in the sync client, a slot is held per attempt, not across backoff
+PERPLEXITY_MAX_INFLIGHT_ASYNC = int(os.getenv("PERPLEXITY_MAX_INFLIGHT_ASYNC", 16))
+
+# asyncio.Semaphore binds to the loop it is first used on, and each
+# asyncio.run() starts a new loop, so keep one per loop
+_inflight_by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _inflight() -> asyncio.Semaphore:
+    """Bulkhead semaphore for the running event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _inflight_by_loop.get(loop)
+    if semaphore is None:
+        semaphore = _inflight_by_loop[loop] = asyncio.Semaphore(PERPLEXITY_MAX_INFLIGHT_ASYNC)
+    return semaphore
+
+
+def new_async_client() -> httpx.AsyncClient:
+    """
+    Create an HTTP/2 client for concurrent Perplexity calls
+
+    HTTP/2 multiplexes all in-flight requests over one connection.
+    Use it as an async context manager so the connection is closed.
+    """
+
+    headers = {"Content-Type": "application/json"}
+    key = _get_api_key()
+    if key:
+        headers["Authorization"] = f"Bearer {key}"
+
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(PERPLEXITY_READ_TIMEOUT, connect=PERPLEXITY_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=32),
+        headers=headers,
+    )
+
+
+async def _post_with_retries_async(
+    client: httpx.AsyncClient,
+    payload: Dict[str, Any],
+    req_id: str
+) -> httpx.Response:
+    """Async version of _post_with_retries, sharing its circuit breaker"""
+
+    if not _BREAKER.allow():
+        raise CircuitOpenError("Perplexity API unavailable after repeated failures. Try again later", req_id)
+
+    try:
+        response = await _post_attempts_async(client, payload, req_id)
+    except httpx.TransportError:
+        _BREAKER.record_failure()
+        raise
+    except BaseException:
+        # Anything else (cancellation, a bug) says nothing about the API,
+        # but must not leave a half-open probe stuck
+        _BREAKER.release_probe()
+        raise
+
+    if response.status_code in _RETRY_STATUSES:
+        _BREAKER.record_failure()
+    else:
+        _BREAKER.record_success()
+
+    return response
+
+
+async def _post_attempts_async(
+    client: httpx.AsyncClient,
+    payload: Dict[str, Any],
+    req_id: str
+) -> httpx.Response:
+    """The retry loop of _post_with_retries_async"""
+
+    body = _json_dumps(payload)
+    headers = {"X-Request-ID": req_id}
+
+    for attempt in range(PERPLEXITY_MAX_ATTEMPTS):
+        final = attempt == PERPLEXITY_MAX_ATTEMPTS - 1
+
+        try:
+            async with _inflight():
+                response = await client.post(PERPLEXITY_API_URL, content=body, headers=headers)
+        except httpx.TransportError:
+            if final:
+                raise
+            delay = _retry_delay(attempt)
+            logger.info("Perplexity request %s failed to connect or timed out, retrying in %.2fs", req_id, delay)
+            await asyncio.sleep(delay)
+            continue
+
+        if final or response.status_code not in _RETRY_STATUSES:
+            return response
+
+        delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+        if delay is None:
+            return response
+
+        logger.info("Perplexity request %s got HTTP %s, retrying in %.2fs", req_id, response.status_code, delay)
+        await asyncio.sleep(delay)
+
+
+async def call_perplexity_async(
+    client: httpx.AsyncClient,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.5,
+    max_tokens: int = 500,
+    use_cache: bool = True,
+    response_format: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Async version of call_perplexity
+
+    Shares the response cache with the synchronous client.
+
+    Args:
+        client: Client from new_async_client()
+        messages: List of message dicts with 'role' and 'content'
+        temperature: Creativity level (0.0 - 1.0)
+        max_tokens: Maximum response length
+        use_cache: Reuse a previous successful response to the same request
+        response_format: Structured output format, e.g. a JSON schema (optional)
+
+    Returns:
+        Response JSON
+
+    Raises:
+        PerplexityTimeout: The request timed out
+        PerplexityError: The call failed for any other reason
+    """
+
+    req_id = uuid.uuid4().hex[:8]
+
+    if not _get_api_key():
+        raise PerplexityError("API key not configured. Set PERPLEXITY_API_KEY environment variable.", req_id)
+
+    payload = {
+        "model": PERPLEXITY_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    if response_format is not None:
+        payload["response_format"] = response_format
+
+    if use_cache:
+        keys = _payload_cache_keys(payload)
+        cached = _cache_lookup(keys)
+        if cached is not None:
+            return cached
+
+    try:
+        response = await _post_with_retries_async(client, payload, req_id)
+
+        if response.status_code != 200:
+            raise _status_error(response.status_code, _error_body(response), req_id)
+
+        data = _json_loads(response.content)
+
+    except PerplexityError:
+        raise
+    except httpx.TimeoutException as e:
+        raise PerplexityTimeout("API request timeout. Please try again", req_id) from e
+    except httpx.TransportError as e:
+        raise PerplexityError("Connection error. Check your internet", req_id) from e
+    except Exception as e:
+        raise PerplexityError(f"Unexpected error: {str(e)}", req_id) from e
+
+    if use_cache:
+        _cache_store(keys, data)
+
+    return data
+
+
+async def analyze_sentiment_async(client: httpx.AsyncClient, review_text: str) -> str:
+    """
+    Async version of analyze_review_sentiment
+
+    Args:
+        client: Client from new_async_client()
+        review_text: The review text to analyze
+
+    Returns:
+        'positive', 'negative', or 'neutral'
+    """
+
+    if not review_text or len(review_text) < 3:
+        return "neutral"
+
+    local = _lexicon_sentiment(review_text)
+    if local is not None:
+        return local
+
+    messages = _sentiment_messages(review_text)
+    try:
+        response = await call_perplexity_async(client, messages, **_SENTIMENT_PARAMS)
+    except PerplexityError as e:
+        logger.warning("Sentiment analysis failed (request %s): %s", e.req_id, e)
+        return "neutral"
+
+    try:
+        content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
+        return _normalize_sentiment(content)
+
+    except (KeyError, IndexError, AttributeError):
+        return "neutral"
+
+
+async def analyze_batch(texts: List[str]) -> List[str]:
+    """
+    Detect the sentiment of many reviews concurrently
+
+    For backfills and bulk re-analysis, e.g.
+    ``asyncio.run(analyze_batch(df["message"].tolist()))``.
+
+    Args:
+        texts: Review texts
+
+    Returns:
+        Sentiments in the same order as texts
+    """
+
+    async with new_async_client() as client:
+        return await asyncio.gather(
+            *(analyze_sentiment_async(client, text) for text in texts)
+        )
+
+
+async def process_review(
+    client: httpx.AsyncClient,
+    review_text: str,
+    category: str
+) -> Dict[str, str]:
+    """
+    Async version of analyze_feedback_all
+
+    Sentiment, summary, response and recommendations come back from a
+    single request. Like analyze_feedback_all, returns the usual fallbacks
+    if the call fails or its reply cannot be parsed, and the short-input
+    defaults without calling the API for feedback under 5 characters.
+
+    Args:
+        client: Client from new_async_client()
+        review_text: The review text
+        category: Category of feedback
+
+    Returns:
+        Dict with 'sentiment', 'summary', 'response' and 'recommendations'
+    """
+
+    if not review_text or len(review_text) < 5:
+        return _short_analysis()
+
+    fields = _analysis_fields(include_response=True)
+    messages = _analysis_messages(review_text, category, fields)
+    try:
+        response = await call_perplexity_async(
+            client,
+            messages,
+            **_ANALYSIS_PARAMS,
+            response_format=_analysis_response_format(fields)
+        )
+    except PerplexityError as e:
+        logger.warning("Feedback analysis failed (request %s): %s", e.req_id, e)
+        return _analysis_fallback(review_text, category)
+
+    try:
+        return _parse_analysis(response, fields)
+
+    except (KeyError, IndexError, AttributeError, TypeError, ValueError) as e:
+        logger.warning("Feedback analysis reply could not be parsed: %s", e)
+        return _analysis_fallback(review_text, category)
+
+
+async def process_batch(
+    reviews: List[Dict[str, Any]],
+    batch_size: int = 5,
+    delay: float = 1.0
+) -> List[Dict[str, str]]:
+    """
+    Analyze many reviews, a batch at a time
+
+    Reviews within a batch run concurrently; batches are separated by
+    `delay` seconds to stay under the API rate limit. Streamlit callers can
+    use ``asyncio.run(process_batch(df.to_dict("records")))``.
+
+    Args:
+        reviews: Dicts with 'message' and 'category', e.g. feedback rows
+        batch_size: Reviews sent concurrently
+        delay: Seconds to wait between batches
+
+    Returns:
+        One process_review result per review, in the same order
+    """
+
+    results = []
+
+    async with new_async_client() as client:
+        for start in range(0, len(reviews), batch_size):
+            if start:
+                await asyncio.sleep(delay)
+
+            batch = reviews[start:start + batch_size]
+            results.extend(
+                await asyncio.gather(
+                    *(process_review(client, review["message"], review["category"]) for review in batch)
+                )
+            )
+
+    return results
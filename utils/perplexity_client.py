@@ -1,24 +1,518 @@
 # utils/perplexity_client.py
 
 import os
+import re
+import time
+import uuid
+import random
+import logging
+import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import json
-from typing import Optional, Dict, List, Any
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple, Any, Iterator
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:  # pragma: no cover - orjson is optional
+    _json_loads = json.loads
+    
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+logger = logging.getLogger(__name__)
+
+PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
+PERPLEXITY_MODEL = "sonar-pro"
+
+# (connect, read) seconds: an unreachable host fails fast, while a long
+# generation still has time to finish
+PERPLEXITY_CONNECT_TIMEOUT = 5
+PERPLEXITY_READ_TIMEOUT = 30
+
+# Seconds analyze_review / analyze_feedback_all may spend on one piece of
+# feedback across all their calls; later calls get whatever is left
+PERPLEXITY_ANALYSIS_BUDGET = 15
+
+# Least time left worth starting an attempt with: any less and it would
+# most likely just time out
+_MIN_REQUEST_TIMEOUT = PERPLEXITY_CONNECT_TIMEOUT
+
+# Transient failures (rate limits, server errors, timeouts) are retried with
+# full-jitter exponential backoff: sleep uniform(0, min(cap, base * 2**attempt))
+PERPLEXITY_MAX_ATTEMPTS = 3
+_RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+_RETRY_BASE_DELAY = 0.5
+_RETRY_MAX_DELAY = 5
+
+# Bulkhead: API requests in flight at once per process. Extra requests
+# queue rather than hammering the API into rate limits. A slot is held per
+# attempt, not across retry backoff or the reading of a stream
+PERPLEXITY_MAX_INFLIGHT = int(os.getenv("PERPLEXITY_MAX_INFLIGHT", 8))
+_INFLIGHT = threading.BoundedSemaphore(PERPLEXITY_MAX_INFLIGHT)
+
+# Consecutive failed calls (after retries) before the circuit breaker opens,
+# and seconds it stays open before letting a probe request through
+_BREAKER_FAILURE_THRESHOLD = 5
+_BREAKER_RECOVERY_TIMEOUT = 30
+
+# Shared session: keeps TCP/TLS connections alive across calls and reruns.
+# Retries are handled by _post_with_retries, not the adapter. Accept-Encoding
+# is deliberately left at requests' default, which adds "br" (and decodes
+# Brotli bodies) only when the brotli package is importable
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+_SESSION.headers.update({"Content-Type": "application/json"})
+
+# Successful API responses keyed by a hash of the request, so repeated
+# feedback text doesn't cost another round-trip. Each response is stored
+# under its exact request and under a normalized one (see _normalize_prompt),
+# so feedback differing only in case, spacing or "!!!" also hits
+_RESPONSE_CACHE_SIZE = 2048
+_response_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Tone of the customer response for each sentiment
+_RESPONSE_TONES = {
+    'positive': 'enthusiastic and grateful',
+    'negative': 'empathetic and solution-focused',
+    'neutral': 'professional and helpful'
+}
+
+# Fixed instructions for each helper, sent as a prebuilt system message so
+# calls share the same prompt prefix and only the user message is built per call
+_SENTIMENT_SYSTEM = {
+    "role": "system",
+    "content": "Analyze the sentiment of the review and respond with ONLY one word: positive, negative, or neutral"
+}
+
+_SUMMARY_SYSTEM = {
+    "role": "system",
+    "content": "Summarize the feedback in exactly one sentence (under 15 words). Respond with only the summary."
+}
+
+_RECOMMENDATION_SYSTEM = {
+    "role": "system",
+    "content": (
+        "Based on the customer feedback, provide ONE actionable recommendation for the team "
+        "(max 1 sentence). Respond with only the recommendation."
+    )
+}
+
+_RESPONSE_INSTRUCTIONS = (
+    "Generate a short, professional customer service response (max 2 sentences) to the "
+    "customer feedback. Respond with only the response."
+)
+
+# Response system message per sentiment; None lets the model match the customer's tone
+_RESPONSE_SYSTEM = {
+    sentiment: {"role": "system", "content": f"{_RESPONSE_INSTRUCTIONS}\nBe {tone}."}
+    for sentiment, tone in _RESPONSE_TONES.items()
+}
+_RESPONSE_SYSTEM[None] = {
+    "role": "system",
+    "content": (
+        f"{_RESPONSE_INSTRUCTIONS}\nMatch the customer's tone: be enthusiastic and grateful for "
+        "positive, empathetic and solution-focused for negative, professional and helpful "
+        "for neutral feedback."
+    )
+}
+
+# Question the recommendation should answer for each sentiment
+_RECOMMENDATION_QUESTIONS = {
+    'negative': 'What specific action should the team take to address this issue?',
+    'positive': 'How can we maintain or build on this positive experience?',
+    'neutral': 'How could we improve based on this feedback?'
+}
+
+# Sampling parameters for each helper
+_SENTIMENT_PARAMS = {"temperature": 0.1, "max_tokens": 10}
+_SUMMARY_PARAMS = {"temperature": 0.2, "max_tokens": 50}
+_RESPONSE_PARAMS = {"temperature": 0.5, "max_tokens": 150}
+_RECOMMENDATION_PARAMS = {"temperature": 0.4, "max_tokens": 80}
+_ANALYSIS_PARAMS = {"temperature": 0.3, "max_tokens": 300}
+
+# JSON keys requested by analyze_feedback_all and how to fill them
+_ANALYSIS_FIELDS = {
+    "sentiment": "one word, positive, negative, or neutral",
+    "summary": "the feedback in exactly one sentence (under 15 words)",
+    "response": (
+        "a short, professional customer service response (max 2 sentences, under 35 words); "
+        "enthusiastic and grateful for positive, empathetic and solution-focused "
+        "for negative, professional and helpful for neutral feedback"
+    ),
+    "recommendations": "ONE actionable recommendation for the team (max 1 sentence, under 25 words)",
+}
+
+# Unambiguous sentiment cues, skipping ones negated by "not"/"never"/"n't".
+# A margin of _LEXICON_MARGIN cues decides the sentiment without an API call
+_NOT_NEGATED = r"(?<!\bnot )(?<!\bnever )(?<!n't )"
+_POS = re.compile(
+    _NOT_NEGATED + r"\b(love[ds]?|loving|excellent|amazing|great|perfect|awesome|fantastic"
+    r"|wonderful|outstanding|brilliant|delighted|superb|impressed|best)\b",
+    re.IGNORECASE
+)
+_NEG = re.compile(
+    _NOT_NEGATED + r"\b(terrible|awful|horrible|worst|broken|crash(?:es|ed|ing)?|useless|unusable"
+    r"|refund|disappointed|disappointing|frustrat(?:ed|ing)|annoying|hate[ds]?|garbage)\b",
+    re.IGNORECASE
+)
+_LEXICON_MARGIN = 2
+
+# Sentiment labels a reply is expected to start with, and the punctuation or
+# markdown that may surround that first word
+_SENTIMENT_LABELS = frozenset(["positive", "negative", "neutral"])
+_LABEL_STRIP_CHARS = ".,!?:;\"'*`"
+
+# First label in a chattier reply, skipping negated ones ("not positive")
+_SENTIMENT_RE = re.compile(_NOT_NEGATED + r"\b(positive|negative|neutral)\b")
+
+# Feedback text is cut to this many characters before it goes into a prompt,
+# so pasted essays don't inflate tokens and latency for every call
+_MAX_INPUT_CHARS = 2000
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Runs of the same punctuation mark ("!!!", "??") in feedback text
+_REPEATED_PUNCT_RE = re.compile(r"([!?.,])\1+")
+
+# Extracts the JSON object from a reply that may be wrapped in prose or code fences
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+_api_key: Optional[str] = None
+
+
+def _get_api_key() -> Optional[str]:
+    """
+    Read the API key from the environment on first use, not at import
+    
+    Also adds it to the shared session's headers. Only a key that is set
+    is remembered, so one exported after a failed call is still picked up.
+    """
+    
+    global _api_key
+    
+    if _api_key is None:
+        key = os.getenv('PERPLEXITY_API_KEY')
+        if not key:
+            logger.warning("PERPLEXITY_API_KEY environment variable not set, AI features are unavailable")
+            return None
+        
+        _SESSION.headers["Authorization"] = f"Bearer {key}"
+        _api_key = key
+    
+    return _api_key
+
+
+class PerplexityError(Exception):
+    """
+    A Perplexity API call failed
+    
+    The message is short enough to show to users; req_id is the
+    X-Request-ID sent with the call, for matching up logs.
+    """
+    
+    def __init__(self, message: str, req_id: Optional[str] = None):
+        super().__init__(message)
+        self.req_id = req_id
+
+
+class PerplexityTimeout(PerplexityError):
+    """The API did not answer in time, or the time budget ran out"""
+
+
+class CircuitOpenError(PerplexityError):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the API is down instead of waiting on every timeout
+    
+    CLOSED: calls go through. After failure_threshold consecutive failures
+    the breaker is OPEN and calls are refused for recovery_timeout seconds.
+    Then it is HALF_OPEN: one probe call goes through, and its outcome
+    closes or reopens the breaker.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a call may be made now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            # Open, or a half-open probe is already in flight
+            return False
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+    
+    def release_probe(self) -> None:
+        """
+        A call ended without saying anything about the API (it was
+        cancelled, or the time budget cut it short)
+        
+        Not counted as a failure, but a half-open probe goes back to OPEN
+        so the next call can probe instead.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+_BREAKER = CircuitBreaker(_BREAKER_FAILURE_THRESHOLD, _BREAKER_RECOVERY_TIMEOUT)
+
+
+def _prompt_text(text: str) -> str:
+    """Feedback text as embedded in prompts: whitespace collapsed, at most _MAX_INPUT_CHARS"""
+    return _WHITESPACE_RE.sub(" ", text).strip()[:_MAX_INPUT_CHARS]
+
+
+def _cache_key(*parts: Any) -> str:
+    """Short, stable hash of the given JSON-serializable values"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[Dict[str, Any]]:
+    """Look up a cached response, marking it as recently used"""
+    with _response_cache_lock:
+        value = _response_cache.get(key)
+        if value is not None:
+            _response_cache.move_to_end(key)
+        return value
+
+
+def _cache_put(key: str, value: Dict[str, Any]) -> None:
+    """Store a response, evicting the least recently used entries"""
+    with _response_cache_lock:
+        _response_cache[key] = value
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _normalize_prompt(text: str) -> str:
+    """Fold differences that don't change a prompt's meaning: case, whitespace, repeated punctuation"""
+    return _REPEATED_PUNCT_RE.sub(r"\1", " ".join(text.split()).casefold())
+
+
+def _payload_cache_keys(payload: Dict[str, Any]) -> List[str]:
+    """Exact and normalized cache keys for a request payload"""
+    normalized = {
+        **payload,
+        "messages": [
+            {**message, "content": _normalize_prompt(message["content"])}
+            for message in payload["messages"]
+        ],
+    }
+    return [_cache_key(payload), _cache_key(normalized)]
+
+
+def _cache_lookup(keys: List[str]) -> Optional[Dict[str, Any]]:
+    """Return the first cached response found under any of the keys"""
+    for key in keys:
+        value = _cache_get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _cache_store(keys: List[str], value: Dict[str, Any]) -> None:
+    """Store a response under every one of the keys"""
+    for key in keys:
+        _cache_put(key, value)
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """
+    Seconds to wait before retrying, or None if it is not worth retrying
+    
+    Honors a numeric Retry-After header, but gives up rather than wait
+    longer than _RETRY_MAX_DELAY.
+    """
+    
+    if retry_after and retry_after.strip().isdigit():
+        delay = float(retry_after)
+        return delay if delay <= _RETRY_MAX_DELAY else None
+    
+    return random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt))
 
-# Get API key from environment variable
-api_key = os.getenv('PERPLEXITY_API_KEY')
 
-if not api_key:
-    print("⚠️  WARNING: PERPLEXITY_API_KEY environment variable not set")
-    print("Please set it before using AI features:")
-    print("  - Mac/Linux: export PERPLEXITY_API_KEY='your-key'")
-    print("  - Windows: set PERPLEXITY_API_KEY=your-key")
+def _time_left(deadline: Optional[float]) -> float:
+    """Seconds until a time.monotonic() deadline; infinite if there is none"""
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+
+def _request_timeout(deadline: Optional[float]) -> Tuple[float, float]:
+    """(connect, read) timeout for one attempt, shrunk to fit the deadline"""
+    remaining = _time_left(deadline)
+    return (min(PERPLEXITY_CONNECT_TIMEOUT, remaining), min(PERPLEXITY_READ_TIMEOUT, remaining))
+
+
+def _post_with_retries(
+    payload: Dict[str, Any],
+    req_id: str,
+    stream: bool = False,
+    deadline: Optional[float] = None
+) -> requests.Response:
+    """
+    POST a request to the API, retrying transient failures
+    
+    Rate limits, server errors, timeouts and connection errors are retried
+    up to PERPLEXITY_MAX_ATTEMPTS times; other responses (including
+    400/401/403) are returned straight away. The last failure is returned
+    or raised when attempts run out or the next one would start too close
+    to the deadline, and counts against the circuit breaker. Raises
+    CircuitOpenError without calling the API while the breaker is open,
+    and PerplexityTimeout when the deadline leaves no time for an attempt
+    or cuts one short; those don't count against the breaker.
+    Every attempt carries req_id as its X-Request-ID header.
+    """
+    
+    if not _BREAKER.allow():
+        raise CircuitOpenError("Perplexity API unavailable after repeated failures. Try again later", req_id)
+    
+    try:
+        response = _post_attempts(payload, req_id, stream, deadline)
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        _BREAKER.record_failure()
+        raise
+    except BaseException:
+        # Anything else (deadline, cancellation, a bug) says nothing about
+        # the API, but must not leave a half-open probe stuck
+        _BREAKER.release_probe()
+        raise
+    
+    if response.status_code in _RETRY_STATUSES:
+        _BREAKER.record_failure()
+    else:
+        _BREAKER.record_success()
+    
+    return response
+
+
+def _post_attempts(
+    payload: Dict[str, Any],
+    req_id: str,
+    stream: bool,
+    deadline: Optional[float]
+) -> requests.Response:
+    """The retry loop of _post_with_retries"""
+    
+    # Serialized once for all attempts; Content-Type is a session header
+    body = _json_dumps(payload)
+    headers = {"X-Request-ID": req_id}
+    
+    for attempt in range(PERPLEXITY_MAX_ATTEMPTS):
+        final = attempt == PERPLEXITY_MAX_ATTEMPTS - 1
+        
+        try:
+            response = _post_attempt(body, headers, req_id, stream, deadline)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            delay = _retry_delay(attempt)
+            if final or delay + _MIN_REQUEST_TIMEOUT > _time_left(deadline):
+                raise
+            logger.info("Perplexity request %s failed to connect or timed out, retrying in %.2fs", req_id, delay)
+            time.sleep(delay)
+            continue
+        
+        if final or response.status_code not in _RETRY_STATUSES:
+            return response
+        
+        delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+        if delay is None or delay + _MIN_REQUEST_TIMEOUT > _time_left(deadline):
+            return response
+        
+        logger.info("Perplexity request %s got HTTP %s, retrying in %.2fs", req_id, response.status_code, delay)
+        response.close()
+        time.sleep(delay)
+
+
+def _post_attempt(
+    body: bytes,
+    headers: Dict[str, str],
+    req_id: str,
+    stream: bool,
+    deadline: Optional[float]
+) -> requests.Response:
+    """
+    One POST, holding a bulkhead slot until the response headers arrive
+    
+    Raises PerplexityTimeout instead of calling the API when the deadline
+    leaves less than _MIN_REQUEST_TIMEOUT, and instead of ReadTimeout when
+    the deadline, not the API, made the timeout expire early.
+    """
+    
+    with _INFLIGHT:
+        # Checked after queueing for the slot, which may have taken a while
+        if _time_left(deadline) < _MIN_REQUEST_TIMEOUT:
+            raise PerplexityTimeout("Time budget used up, skipping API call", req_id)
+        
+        timeout = _request_timeout(deadline)
+        try:
+            return _SESSION.post(PERPLEXITY_API_URL, data=body, headers=headers, timeout=timeout, stream=stream)
+        except requests.exceptions.ReadTimeout as e:
+            if timeout[1] < PERPLEXITY_READ_TIMEOUT:
+                raise PerplexityTimeout("Time budget used up waiting for the API", req_id) from e
+            raise
+
+
+def _error_body(response: requests.Response, limit: int = 512) -> str:
+    """First few hundred characters of an error response body"""
+    return response.content[:limit].decode("utf-8", "replace")
+
+
+def _status_error(status_code: int, body: str, req_id: str) -> PerplexityError:
+    """Exception describing a non-200 API response"""
+    
+    if status_code == 401:
+        message = "Unauthorized - Invalid API key. Check your PERPLEXITY_API_KEY"
+    elif status_code == 429:
+        message = "Rate limit exceeded. Please try again later"
+    elif status_code == 500:
+        message = "Perplexity API server error. Try again later"
+    else:
+        message = f"API Error {status_code}: {body}"
+    
+    return PerplexityError(message, req_id)
 
 
 def call_perplexity(
     messages: List[Dict[str, str]],
     temperature: float = 0.5,
-    max_tokens: int = 500
+    max_tokens: int = 500,
+    use_cache: bool = True,
+    deadline: Optional[float] = None,
+    response_format: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Call Perplexity API with error handling
@@ -27,70 +521,149 @@ def call_perplexity(
         messages: List of message dicts with 'role' and 'content'
         temperature: Creativity level (0.0 - 1.0)
         max_tokens: Maximum response length
+        use_cache: Reuse a previous successful response to the same request
+        deadline: time.monotonic() by which the call must finish (optional)
+        response_format: Structured output format, e.g. a JSON schema (optional)
     
     Returns:
-        Response JSON or error dict
+        Response JSON
+    
+    Raises:
+        PerplexityTimeout: The request timed out or the deadline had passed
+        PerplexityError: The call failed for any other reason
     """
     
-    if not api_key:
-        return {
-            "error": "API key not configured. Set PERPLEXITY_API_KEY environment variable."
-        }
+    req_id = uuid.uuid4().hex[:8]
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    if not _get_api_key():
+        raise PerplexityError("API key not configured. Set PERPLEXITY_API_KEY environment variable.", req_id)
     
     payload = {
-        "model": "sonar-pro",
+        "model": PERPLEXITY_MODEL,
         "messages": messages,
         "temperature": temperature,
         "max_tokens": max_tokens
     }
+    if response_format is not None:
+        payload["response_format"] = response_format
+    
+    if use_cache:
+        keys = _payload_cache_keys(payload)
+        cached = _cache_lookup(keys)
+        if cached is not None:
+            return cached
+    
+    if _time_left(deadline) < _MIN_REQUEST_TIMEOUT:
+        raise PerplexityTimeout("Time budget used up, skipping API call", req_id)
     
     try:
-        response = requests.post(
-            "https://api.perplexity.ai/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=15
-        )
+        response = _post_with_retries(payload, req_id, deadline=deadline)
         
-        # Handle different status codes
-        if response.status_code == 401:
-            return {
-                "error": "Unauthorized - Invalid API key. Check your PERPLEXITY_API_KEY"
-            }
-        elif response.status_code == 429:
-            return {
-                "error": "Rate limit exceeded. Please try again later"
-            }
-        elif response.status_code == 500:
-            return {
-                "error": "Perplexity API server error. Try again later"
-            }
-        elif response.status_code != 200:
-            return {
-                "error": f"API Error {response.status_code}: {response.text}"
-            }
+        if response.status_code != 200:
+            raise _status_error(response.status_code, _error_body(response), req_id)
         
-        return response.json()
+        data = _json_loads(response.content)
     
-    except requests.exceptions.Timeout:
-        return {"error": "API request timeout. Please try again"}
-    except requests.exceptions.ConnectionError:
-        return {"error": "Connection error. Check your internet"}
+    except PerplexityError:
+        raise
+    except requests.exceptions.Timeout as e:
+        raise PerplexityTimeout("API request timeout. Please try again", req_id) from e
+    except requests.exceptions.ConnectionError as e:
+        raise PerplexityError("Connection error. Check your internet", req_id) from e
     except Exception as e:
-        return {"error": f"Unexpected error: {str(e)}"}
+        raise PerplexityError(f"Unexpected error: {str(e)}", req_id) from e
+    
+    if use_cache:
+        _cache_store(keys, data)
+    
+    return data
 
 
-def analyze_review_sentiment(review_text: str) -> str:
+def call_perplexity_stream(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.5,
+    max_tokens: int = 500,
+    use_cache: bool = True,
+    deadline: Optional[float] = None
+) -> Iterator[str]:
+    """
+    Call Perplexity API and yield the reply text as it is generated
+    
+    Args:
+        messages: List of message dicts with 'role' and 'content'
+        temperature: Creativity level (0.0 - 1.0)
+        max_tokens: Maximum response length
+        use_cache: Reuse a previous successful response to the same request
+        deadline: time.monotonic() by which the reply must start (optional)
+    
+    Yields:
+        Chunks of the reply text; nothing if the request fails (the
+        failure is logged)
+    """
+    
+    req_id = uuid.uuid4().hex[:8]
+    
+    if not _get_api_key():
+        logger.warning("Streaming request %s failed: API key not configured", req_id)
+        return
+    
+    payload = {
+        "model": PERPLEXITY_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    
+    # Shares cache entries with call_perplexity for the same request
+    if use_cache:
+        keys = _payload_cache_keys(payload)
+        cached = _cache_lookup(keys)
+        if cached is not None:
+            yield cached['choices'][0]['message']['content']
+            return
+    
+    if _time_left(deadline) < _MIN_REQUEST_TIMEOUT:
+        logger.warning("Streaming request %s skipped: time budget used up", req_id)
+        return
+    
+    try:
+        with _post_with_retries({**payload, "stream": True}, req_id, stream=True, deadline=deadline) as response:
+            if response.status_code != 200:
+                raise _status_error(response.status_code, _error_body(response), req_id)
+            
+            parts = []
+            
+            # Server-sent events: one "data: {...}" line per chunk
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                
+                chunk = _json_loads(data)
+                delta = chunk.get('choices', [{}])[0].get('delta', {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            
+            if use_cache and parts:
+                _cache_store(keys, {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]})
+    
+    except (PerplexityError, requests.exceptions.RequestException) as e:
+        logger.warning("Streaming request %s failed: %s", req_id, e)
+    except (ValueError, IndexError, AttributeError) as e:
+        logger.warning("Streaming request %s returned an unreadable chunk: %s", req_id, e)
+
+
+def analyze_review_sentiment(review_text: str, deadline: Optional[float] = None) -> str:
     """
     Analyze sentiment of a review
     
     Args:
         review_text: The review text to analyze
+        deadline: time.monotonic() by which to give up and return 'neutral' (optional)
     
     Returns:
         'positive', 'negative', or 'neutral'
@@ -99,44 +672,63 @@ def analyze_review_sentiment(review_text: str) -> str:
     if not review_text or len(review_text) < 3:
         return "neutral"
     
-    messages = [
-        {
-            "role": "user",
-            "content": f"""Analyze the sentiment of this review and respond with ONLY one word:
-            
-Review: {review_text}
-
-Respond with ONLY: positive, negative, or neutral"""
-        }
-    ]
+    local = _lexicon_sentiment(review_text)
+    if local is not None:
+        return local
     
-    response = call_perplexity(messages, temperature=0.1, max_tokens=10)
-    
-    if "error" in response:
-        print(f"Sentiment analysis error: {response['error']}")
+    messages = _sentiment_messages(review_text)
+    try:
+        response = call_perplexity(messages, **_SENTIMENT_PARAMS, deadline=deadline)
+    except PerplexityError as e:
+        logger.warning("Sentiment analysis failed (request %s): %s", e.req_id, e)
         return "neutral"
     
     try:
-        content = response.get('choices', [{}])[0].get('message', {}).get('content', '').lower().strip()
-        
-        # Clean up response
-        content = content.replace('.', '').replace('!', '').replace(',', '')
-        
-        if 'positive' in content:
-            return 'positive'
-        elif 'negative' in content:
-            return 'negative'
-        else:
-            return 'neutral'
+        content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
+        return _normalize_sentiment(content)
     
     except (KeyError, IndexError, AttributeError):
         return "neutral"
 
 
+def _sentiment_messages(review_text: str) -> List[Dict[str, str]]:
+    """Build the one-word sentiment classification prompt"""
+    return [_SENTIMENT_SYSTEM, {"role": "user", "content": f"Review: {_prompt_text(review_text)}"}]
+
+
+def _lexicon_sentiment(review_text: str) -> Optional[str]:
+    """Sentiment from strong cue words, or None if they don't clearly decide it"""
+    
+    margin = len(_POS.findall(review_text)) - len(_NEG.findall(review_text))
+    
+    if margin >= _LEXICON_MARGIN:
+        return "positive"
+    if margin <= -_LEXICON_MARGIN:
+        return "negative"
+    return None
+
+
+def _normalize_sentiment(content: str) -> str:
+    """Map a free-text model reply onto positive/negative/neutral"""
+    
+    content = content.lower()
+    
+    # The prompt asks for one word, so the first word almost always decides it
+    words = content.split(maxsplit=1)
+    if words:
+        first = words[0].strip(_LABEL_STRIP_CHARS)
+        if first in _SENTIMENT_LABELS:
+            return first
+    
+    match = _SENTIMENT_RE.search(content)
+    return match.group(1) if match else 'neutral'
+
+
 def generate_ai_response(
     user_message: str,
     category: str,
-    sentiment: Optional[str] = None
+    sentiment: Optional[str] = None,
+    deadline: Optional[float] = None
 ) -> str:
     """
     Generate a professional AI response to user feedback
@@ -146,6 +738,7 @@ def generate_ai_response(
         user_message: The user's feedback message
         category: Category of feedback
         sentiment: Detected sentiment (optional - will be auto-detected if not provided)
+        deadline: time.monotonic() by which to give up and use the fallback (optional)
     
     Returns:
         AI-generated response string
@@ -156,34 +749,14 @@ def generate_ai_response(
     
     # AUTO-DETECT SENTIMENT if not provided
     if sentiment is None:
-        sentiment = analyze_review_sentiment(user_message)
-    
-    tone_map = {
-        'positive': 'enthusiastic and grateful',
-        'negative': 'empathetic and solution-focused',
-        'neutral': 'professional and helpful'
-    }
-    
-    tone = tone_map.get(sentiment, 'professional')
-    
-    messages = [
-        {
-            "role": "user",
-            "content": f"""Generate a short, professional customer service response (max 2 sentences) to this feedback.
-Be {tone}.
-
-Category: {category}
-Customer Feedback: {user_message}
-
-Response:"""
-        }
-    ]
-    
-    response = call_perplexity(messages, temperature=0.5, max_tokens=150)
+        sentiment = analyze_review_sentiment(user_message, deadline=deadline)
     
-    if "error" in response:
-        print(f"Response generation error: {response['error']}")
-        return f"Thank you for your {sentiment} feedback about {category}. We appreciate your input!"
+    messages = _response_messages(user_message, category, sentiment)
+    try:
+        response = call_perplexity(messages, **_RESPONSE_PARAMS, deadline=deadline)
+    except PerplexityError as e:
+        logger.warning("Response generation failed (request %s): %s", e.req_id, e)
+        return _response_fallback(category, sentiment)
     
     try:
         content = response.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
@@ -198,12 +771,68 @@ Response:"""
         return "Thank you for your feedback!"
 
 
-def generate_summary(review_text: str) -> str:
+def stream_ai_response(
+    user_message: str,
+    category: str,
+    sentiment: Optional[str] = None,
+    deadline: Optional[float] = None
+) -> Iterator[str]:
+    """
+    Stream a professional AI response to user feedback
+    Does NOT detect sentiment first - without one the model matches the
+    customer's tone itself, so text starts arriving after a single request
+    
+    Args:
+        user_message: The user's feedback message
+        category: Category of feedback
+        sentiment: Detected sentiment (optional)
+        deadline: time.monotonic() by which the reply must start (optional)
+    
+    Yields:
+        Chunks of the response (max 200 chars), or the fallback text on error
+    """
+    
+    if not user_message or len(user_message) < 5:
+        yield "Thank you for your feedback!"
+        return
+    
+    messages = _response_messages(user_message, category, sentiment)
+    remaining = 200  # Same limit as generate_ai_response
+    
+    for chunk in call_perplexity_stream(messages, **_RESPONSE_PARAMS, deadline=deadline):
+        if remaining == 200:
+            chunk = chunk.lstrip()
+        
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+        
+        if remaining <= 0:
+            break
+    
+    if remaining == 200:
+        yield _response_fallback(category, sentiment)
+
+
+def _response_messages(
+    user_message: str,
+    category: str,
+    sentiment: Optional[str]
+) -> List[Dict[str, str]]:
+    """Build the customer response prompt, with a tone matching the sentiment"""
+    return [
+        _RESPONSE_SYSTEM.get(sentiment, _RESPONSE_SYSTEM['neutral']),
+        {"role": "user", "content": f"Category: {category}\nCustomer Feedback: {_prompt_text(user_message)}"}
+    ]
+
+
+def generate_summary(review_text: str, deadline: Optional[float] = None) -> str:
     """
     Generate a one-sentence summary of a review
     
     Args:
         review_text: The review text to summarize
+        deadline: time.monotonic() by which to give up and use the fallback (optional)
     
     Returns:
         One-sentence summary
@@ -212,22 +841,12 @@ def generate_summary(review_text: str) -> str:
     if not review_text or len(review_text) < 5:
         return "Short feedback received"
     
-    messages = [
-        {
-            "role": "user",
-            "content": f"""Summarize this feedback in exactly one sentence (under 15 words):
-
-Feedback: {review_text}
-
-Summary:"""
-        }
-    ]
-    
-    response = call_perplexity(messages, temperature=0.2, max_tokens=50)
-    
-    if "error" in response:
-        print(f"Summary generation error: {response['error']}")
-        return review_text[:50] + "..." if len(review_text) > 50 else review_text
+    messages = _summary_messages(review_text)
+    try:
+        response = call_perplexity(messages, **_SUMMARY_PARAMS, deadline=deadline)
+    except PerplexityError as e:
+        logger.warning("Summary generation failed (request %s): %s", e.req_id, e)
+        return _summary_fallback(review_text)
     
     try:
         content = response.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
@@ -247,7 +866,8 @@ Summary:"""
 def generate_recommendations(
     review_text: str,
     category: str,
-    sentiment: Optional[str] = None
+    sentiment: Optional[str] = None,
+    deadline: Optional[float] = None
 ) -> str:
     """
     Generate actionable recommendations based on feedback
@@ -257,6 +877,7 @@ def generate_recommendations(
         review_text: The review text
         category: Category of feedback
         sentiment: Detected sentiment (optional - will be auto-detected if not provided)
+        deadline: time.monotonic() by which to give up and use the fallback (optional)
     
     Returns:
         Recommended action for the team
@@ -267,43 +888,14 @@ def generate_recommendations(
     
     # AUTO-DETECT SENTIMENT if not provided
     if sentiment is None:
-        sentiment = analyze_review_sentiment(review_text)
-    
-    action_prompt = {
-        'negative': 'What specific action should the team take to address this issue?',
-        'positive': 'How can we maintain or build on this positive experience?',
-        'neutral': 'How could we improve based on this feedback?'
-    }
+        sentiment = analyze_review_sentiment(review_text, deadline=deadline)
     
-    prompt = action_prompt.get(sentiment, 'How should we respond to this feedback?')
-    
-    messages = [
-        {
-            "role": "user",
-            "content": f"""Based on this customer feedback, provide ONE actionable recommendation (max 1 sentence).
-
-Category: {category}
-Sentiment: {sentiment}
-Feedback: {review_text}
-
-{prompt}
-
-Recommendation:"""
-        }
-    ]
-    
-    response = call_perplexity(messages, temperature=0.4, max_tokens=80)
-    
-    if "error" in response:
-        print(f"Recommendation generation error: {response['error']}")
-        
-        # Return smart fallback based on sentiment
-        if sentiment == 'negative':
-            return "Investigate and resolve the reported issue"
-        elif sentiment == 'positive':
-            return "Document and replicate this successful approach"
-        else:
-            return "Analyze feedback for potential improvements"
+    messages = _recommendation_messages(review_text, category, sentiment)
+    try:
+        response = call_perplexity(messages, **_RECOMMENDATION_PARAMS, deadline=deadline)
+    except PerplexityError as e:
+        logger.warning("Recommendation generation failed (request %s): %s", e.req_id, e)
+        return _recommendation_fallback(sentiment)
     
     try:
         content = response.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
@@ -320,6 +912,255 @@ Recommendation:"""
         return "Review and act on feedback"
 
 
+def _summary_messages(review_text: str) -> List[Dict[str, str]]:
+    """Build the one-sentence summary prompt"""
+    return [_SUMMARY_SYSTEM, {"role": "user", "content": f"Feedback: {_prompt_text(review_text)}"}]
+
+
+def _recommendation_messages(
+    review_text: str,
+    category: str,
+    sentiment: str
+) -> List[Dict[str, str]]:
+    """Build the team recommendation prompt, asking the question that fits the sentiment"""
+    
+    question = _RECOMMENDATION_QUESTIONS.get(sentiment, 'How should we respond to this feedback?')
+    
+    return [
+        _RECOMMENDATION_SYSTEM,
+        {
+            "role": "user",
+            "content": f"""Category: {category}
+Sentiment: {sentiment}
+Feedback: {_prompt_text(review_text)}
+
+{question}"""
+        }
+    ]
+
+
+def analyze_review(
+    review_text: str,
+    category: str,
+    include_response: bool = True,
+    deadline: Optional[float] = None
+) -> Dict[str, str]:
+    """
+    Analyze feedback with the per-field helpers, running them concurrently
+    
+    Sentiment and summary are requested in parallel. The customer response
+    and recommendation are worded for the sentiment, so both are requested
+    together once it is known: two round-trips instead of four. Helpers
+    still running when the time budget is spent return their fallbacks.
+    
+    Args:
+        review_text: The review text
+        category: Category of feedback
+        include_response: Also generate the customer response
+        deadline: time.monotonic() by which to finish (default:
+            PERPLEXITY_ANALYSIS_BUDGET seconds from now)
+    
+    Returns:
+        Dict with 'sentiment', 'summary', 'recommendations' and, if
+        requested, 'response'
+    """
+    
+    if deadline is None:
+        deadline = time.monotonic() + PERPLEXITY_ANALYSIS_BUDGET
+    
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        summary = executor.submit(generate_summary, review_text, deadline)
+        sentiment = analyze_review_sentiment(review_text, deadline)
+        
+        recommendations = executor.submit(generate_recommendations, review_text, category, sentiment, deadline)
+        if include_response:
+            response = executor.submit(generate_ai_response, review_text, category, sentiment, deadline)
+        
+        analysis = {
+            "sentiment": sentiment,
+            "summary": summary.result(),
+            "recommendations": recommendations.result(),
+        }
+        if include_response:
+            analysis["response"] = response.result()
+    
+    return analysis
+
+
+def analyze_feedback_all(
+    message: str,
+    category: str,
+    include_response: bool = True,
+    deadline: Optional[float] = None
+) -> Dict[str, str]:
+    """
+    Analyze feedback with a single API call
+    
+    Sentiment, summary, customer response and team recommendation are
+    requested together as one JSON object, constrained by a JSON schema.
+    Returns the usual fallbacks if the call fails or its reply cannot be
+    parsed, and the short-input defaults without calling the API for
+    feedback under 5 characters.
+    
+    Args:
+        message: The user's feedback message
+        category: Category of feedback
+        include_response: Also generate the customer response (skip it when
+            the response is streamed separately)
+        deadline: time.monotonic() by which to finish (default:
+            PERPLEXITY_ANALYSIS_BUDGET seconds from now)
+    
+    Returns:
+        Dict with 'sentiment', 'summary', 'recommendations' and, if
+        requested, 'response'
+    """
+    
+    if deadline is None:
+        deadline = time.monotonic() + PERPLEXITY_ANALYSIS_BUDGET
+    
+    if not message or len(message) < 5:
+        return _short_analysis(include_response)
+    
+    fields = _analysis_fields(include_response)
+    messages = _analysis_messages(message, category, fields)
+    try:
+        response = call_perplexity(
+            messages,
+            **_ANALYSIS_PARAMS,
+            deadline=deadline,
+            response_format=_analysis_response_format(fields)
+        )
+    except PerplexityError as e:
+        logger.warning("Feedback analysis failed (request %s): %s", e.req_id, e)
+        return _analysis_fallback(message, category, include_response)
+    
+    try:
+        return _parse_analysis(response, fields)
+    
+    except (KeyError, IndexError, AttributeError, TypeError, ValueError) as e:
+        logger.warning("Feedback analysis reply could not be parsed: %s", e)
+        return _analysis_fallback(message, category, include_response)
+
+
+def _analysis_fields(include_response: bool) -> List[str]:
+    """JSON keys to request from the fused analysis prompt"""
+    return [key for key in _ANALYSIS_FIELDS if include_response or key != "response"]
+
+
+def _analysis_messages(message: str, category: str, fields: List[str]) -> List[Dict[str, str]]:
+    """Build the fused analysis prompt asking for a JSON object with the given keys"""
+    
+    field_lines = "\n".join(f'- "{key}": {_ANALYSIS_FIELDS[key]}' for key in fields)
+    
+    return [
+        {
+            "role": "user",
+            "content": f"""Analyze this customer feedback and respond with ONLY a JSON object with these keys:
+
+{field_lines}
+
+Category: {category}
+Customer Feedback: {_prompt_text(message)}"""
+        }
+    ]
+
+
+def _analysis_response_format(fields: List[str]) -> Dict[str, Any]:
+    """Structured output format making the model reply with exactly the requested keys"""
+    
+    properties = {key: {"type": "string"} for key in fields}
+    properties["sentiment"] = {"type": "string", "enum": ["positive", "negative", "neutral"]}
+    
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": fields,
+            }
+        },
+    }
+
+
+def _parse_analysis(response: Dict[str, Any], fields: List[str]) -> Dict[str, str]:
+    """
+    Extract the fused analysis from an API response
+    
+    Raises KeyError, TypeError or ValueError if the reply is not a JSON
+    object with a non-empty value for every field.
+    """
+    
+    content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
+    match = _JSON_OBJECT_RE.search(content)
+    if not match:
+        raise ValueError("no JSON object in reply")
+    
+    result = _json_loads(match.group(0))
+    
+    analysis = {key: str(result[key]).strip() for key in fields}
+    if not all(analysis.values()):
+        raise ValueError("empty field in analysis")
+    
+    analysis["sentiment"] = _normalize_sentiment(analysis["sentiment"])
+    analysis["summary"] = analysis["summary"][:100]
+    analysis["recommendations"] = analysis["recommendations"][:150]
+    if "response" in analysis:
+        analysis["response"] = analysis["response"][:200]
+    
+    return analysis
+
+
+def _analysis_fallback(message: str, category: str, include_response: bool = True) -> Dict[str, str]:
+    """Fused analysis result used when the API is unavailable"""
+    
+    analysis = {
+        "sentiment": "neutral",
+        "summary": _summary_fallback(message),
+        "recommendations": _recommendation_fallback("neutral"),
+    }
+    if include_response:
+        analysis["response"] = _response_fallback(category, "neutral")
+    
+    return analysis
+
+
+def _short_analysis(include_response: bool = True) -> Dict[str, str]:
+    """Analysis of feedback too short to send to the API"""
+    
+    analysis = {
+        "sentiment": "neutral",
+        "summary": "Short feedback received",
+        "recommendations": "Monitor feedback quality",
+    }
+    if include_response:
+        analysis["response"] = "Thank you for your feedback!"
+    
+    return analysis
+
+
+def _summary_fallback(review_text: str) -> str:
+    """Summary used when the API is unavailable"""
+    return review_text[:50] + "..." if len(review_text) > 50 else review_text
+
+
+def _response_fallback(category: str, sentiment: Optional[str]) -> str:
+    """Customer response used when the API is unavailable"""
+    if sentiment is None:
+        return f"Thank you for your feedback about {category}. We appreciate your input!"
+    return f"Thank you for your {sentiment} feedback about {category}. We appreciate your input!"
+
+
+def _recommendation_fallback(sentiment: Optional[str]) -> str:
+    """Smart recommendation fallback based on sentiment"""
+    if sentiment == 'negative':
+        return "Investigate and resolve the reported issue"
+    elif sentiment == 'positive':
+        return "Document and replicate this successful approach"
+    else:
+        return "Analyze feedback for potential improvements"
+
+
 def test_api_connection() -> bool:
     """
     Test if API key is valid and working
@@ -328,15 +1169,15 @@ def test_api_connection() -> bool:
         True if API is reachable, False otherwise
     """
     
-    if not api_key:
+    if not _get_api_key():
         print("❌ API key not configured")
         return False
     
     messages = [{"role": "user", "content": "Hello"}]
-    response = call_perplexity(messages, temperature=0.1, max_tokens=5)
-    
-    if "error" in response:
-        print(f"❌ API Error: {response['error']}")
+    try:
+        call_perplexity(messages, temperature=0.1, max_tokens=5, use_cache=False)
+    except PerplexityError as e:
+        print(f"❌ API Error: {e}")
         return False
     
     print("✅ API Connection Successful")